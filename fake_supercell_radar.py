@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import numpy as np
+import argparse
+import functools
 import math
-import random
-import sys
+import multiprocessing
 from datetime import datetime
 import time
 import os
@@ -13,8 +15,22 @@ CENTER_X, CENTER_Y = WIDTH // 2, HEIGHT // 2
 RADAR_NAME = "Bordeaux KBDX (KRAD Bordeaux)"
 BLIND_SPOT_RADIUS = 14
 
+# Radar products are smooth fields, so they are synthesized on a coarser grid
+# and upsampled; physics constants stay in full-resolution pixels
+RENDER_SCALE = 2
+RENDER_WIDTH, RENDER_HEIGHT = WIDTH // RENDER_SCALE, HEIGHT // RENDER_SCALE
+RENDER_OFFSET = (RENDER_SCALE - 1) / 2
+# Most frames rendered in one batch; every float32 temporary scales with it
+FRAME_BATCH = 8
+
 MAP_IMAGE_PATH = "image.png"
 
+RNG = np.random.default_rng()
+
+# Render buffer reused by every render in this process, one frame per row of
+# the leading axis; see scratch_buffer(). Finished images are copies
+SCRATCH = np.empty((1, RENDER_HEIGHT, RENDER_WIDTH, 4), dtype=np.uint8)
+
 # Color tables for products
 REFLECTIVITY_COLORS = [
     (0, 5, (0, 0, 0)),
@@ -58,49 +74,199 @@ SW_COLORS = [
 def lerp_color(c1, c2, t):
     return tuple(int(a + (b - a) * t) for a, b in zip(c1, c2))
 
-def get_color_from_table(value, color_table):
-    for low, high, color in color_table:
-        if low <= value < high:
-            return color
-    return color_table[-1][2]
+# Color tables as parallel arrays (low edges, high edges, RGB rows), built
+# once at import so lookups are a searchsorted and a gather on C arrays
+def build_palette(color_table):
+    low = np.array([low for low, _, _ in color_table], dtype=np.float64)
+    high = np.array([high for _, high, _ in color_table], dtype=np.float64)
+    rgb = np.array([color for _, _, color in color_table], dtype=np.uint8)
+    return low, high, rgb
+
+PALETTES = {
+    "REFLECTIVITY": build_palette(REFLECTIVITY_COLORS),
+    "VELOCITY": build_palette(VELOCITY_COLORS),
+    "ZDR": build_palette(ZDR_COLORS),
+    "CC": build_palette(CC_COLORS),
+    "SW": build_palette(SW_COLORS),
+}
+
+# Colorbar swatches and labels per product
+COLORBAR_SPEC = {
+    "REFLECTIVITY": ([c for _, _, c in REFLECTIVITY_COLORS], ["0", "5", "20", "30", "40", "50", "60", "80"]),
+    "VELOCITY": ([c for _, _, c in VELOCITY_COLORS], ["-120", "-60", "-40", "-20", "0", "20", "40", "120"]),
+    "ZDR": ([c for _, _, c in ZDR_COLORS], ["-2", "-0.5", "0.5", "2"]),
+    "CC": ([c for _, _, c in CC_COLORS], ["0", "0.6", "0.9", "1"]),
+    "SW": ([c for _, _, c in SW_COLORS], ["0", "1", "2", "5"]),
+}
+
+# Palette lookups run on fixed-point int16 values; every palette edge is a
+# whole multiple of 1 / PALETTE_QUANT, so flooring keeps the binning exact
+PALETTE_QUANT = 100
+QUANTIZED_EDGES = {
+    name: np.rint(high * PALETTE_QUANT).astype(np.int16)
+    for name, (_, high, _) in PALETTES.items()
+}
+
+# CuPy is only imported when --gpu asks for it, see load_cupy()
+cupy = None
+
+# Import CuPy and check that a CUDA device is usable; returns None otherwise
+def load_cupy():
+    global cupy
+    try:
+        import cupy as cp
+        if cp.cuda.runtime.getDeviceCount() > 0:
+            cupy = cp
+    except Exception:
+        cupy = None
+    return cupy
+
+# NumPy or CuPy, whichever module owns the array
+def array_module(arr):
+    return cupy.get_array_module(arr) if cupy is not None else np
+
+def to_host(arr):
+    return arr if array_module(arr) is np else cupy.asnumpy(arr)
+
+def quantize_field(arr, name):
+    xp = array_module(arr)
+    low, high, _ = PALETTES[name]
+    # Clip with Python float bounds so a float32 field stays float32, then
+    # scale in float64: float32(0.9) * 100 rounds to exactly 90 and would
+    # land in the next bin, while the float64 product stays below it
+    clipped = xp.clip(arr, float(low[0]), float(high[-1]))
+    return xp.floor(clipped.astype(np.float64) * PALETTE_QUANT).astype(np.int16)
+
+def apply_palette(arr, name):
+    xp = array_module(arr)
+    rgb = xp.asarray(PALETTES[name][2])
+    idx = xp.searchsorted(xp.asarray(QUANTIZED_EDGES[name]), quantize_field(arr, name), side="right")
+    return rgb[idx.clip(max=len(rgb) - 1)]
+
+# Write a whole value field through a palette into a zeroed RGBA buffer;
+# pixels flagged as outside the storm are left fully transparent. The
+# outside mask broadcasts over any leading frame axis of the field
+def colorize_field(rgba, val, outside, name):
+    inside = ~array_module(val).broadcast_to(outside, val.shape)
+    # Mask the color and alpha views rather than mixing a mask with a
+    # slice in one index, which CuPy does not handle like NumPy
+    rgb, alpha = rgba[..., :3], rgba[..., 3]
+    rgb[inside] = apply_palette(val[inside], name)
+    alpha[inside] = 255
 
 def get_text_size(font, text):
     bbox = font.getbbox(text)
     return bbox[2] - bbox[0], bbox[3] - bbox[1]
 
-def draw_grid(draw, spacing=80):
+# Grid geometry never changes, so ring boxes and ray endpoints are computed once
+GRID_SPACING = 80
+GRID_RINGS = [
+    (CENTER_X - r, CENTER_Y - r, CENTER_X + r, CENTER_Y + r)
+    for r in range(GRID_SPACING, WIDTH // 2, GRID_SPACING)
+]
+GRID_RAYS = [
+    (CENTER_X, CENTER_Y,
+     CENTER_X + math.cos(math.radians(angle_deg)) * (WIDTH // 2),
+     CENTER_Y + math.sin(math.radians(angle_deg)) * (HEIGHT // 2))
+    for angle_deg in range(0, 360, 30)
+]
+
+def draw_grid(draw):
     ring_color = (60, 60, 60)
-    for r in range(spacing, WIDTH // 2, spacing):
-        draw.ellipse([
-            CENTER_X - r, CENTER_Y - r,
-            CENTER_X + r, CENTER_Y + r
-        ], outline=ring_color, width=1)
-
-    for angle_deg in range(0, 360, 30):
-        angle_rad = math.radians(angle_deg)
-        x = CENTER_X + math.cos(angle_rad) * (WIDTH // 2)
-        y = CENTER_Y + math.sin(angle_rad) * (HEIGHT // 2)
-        draw.line([CENTER_X, CENTER_Y, x, y], fill=ring_color, width=1)
-
-def add_speckle_noise(pixels, chance=0.002):
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            if random.random() < chance:
-                noise = random.randint(150, 255)
-                pixels[x, y] = (noise, noise, noise)
+    for ring in GRID_RINGS:
+        draw.ellipse(ring, outline=ring_color, width=1)
+
+    for ray in GRID_RAYS:
+        draw.line(ray, fill=ring_color, width=1)
+
+def add_speckle_noise(rgba, chance=0.002):
+    # A render pixel covers RENDER_SCALE**2 output pixels: draw speckles at
+    # that many times the per-pixel chance so the count per frame matches the
+    # full-resolution output, and mix in a single output pixel's share so each
+    # one blurs out as faintly as at full size
+    mask = RNG.random(rgba.shape[:2]) < chance * RENDER_SCALE ** 2
+    speckle = np.full((np.count_nonzero(mask), 4), 255.0)
+    speckle[:, :3] = RNG.integers(150, 256, size=(len(speckle), 1))
+    weight = 1 / RENDER_SCALE ** 2
+    rgba[mask] = np.rint(rgba[mask] * (1 - weight) + speckle * weight).astype(np.uint8)
+
+# Cached grids are shared between calls, so guard them against in-place edits
+def readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+# A batch of frames takes the leading slice of SCRATCH, which grows the first
+# time a larger batch comes along and is reused after that
+def scratch_buffer(frames):
+    global SCRATCH
+    if len(SCRATCH) < frames:
+        SCRATCH = np.empty((frames, RENDER_HEIGHT, RENDER_WIDTH, 4), dtype=np.uint8)
+    return SCRATCH[:frames]
+
+# Per-pixel noise for the generators, drawn as float32 like the rest of
+# the field math to halve memory traffic against float64. With CuPy it is
+# drawn on the device by a generator seeded from RNG, so no host array is
+# copied over and a seeded RNG still gives a repeatable storm
+def noise_field(amplitude, shape, xp=np):
+    if xp is np:
+        noise = RNG.random(shape, dtype=np.float32)
+    else:
+        noise = xp.random.default_rng(int(RNG.integers(2 ** 63))).random(shape, dtype=np.float32)
+    return (noise * 2 - 1) * amplitude
+
+# Full-resolution coordinates of the render grid's pixel centers
+@functools.lru_cache(maxsize=2)
+def render_grid(xp=np):
+    if xp is not np:
+        return tuple(xp.asarray(arr) for arr in render_grid(np))
+    yy, xx = np.ogrid[:RENDER_HEIGHT, :RENDER_WIDTH]
+    yy = (yy * RENDER_SCALE + RENDER_OFFSET).astype(np.float32)
+    xx = (xx * RENDER_SCALE + RENDER_OFFSET).astype(np.float32)
+    return readonly(yy), readonly(xx)
+
+# Distance and angle from the radar for every render pixel, shared by all
+# products and frames; rotation is added to the angle at the use site
+@functools.lru_cache(maxsize=2)
+def polar_grid(xp=np):
+    if xp is not np:
+        return tuple(xp.asarray(arr) for arr in polar_grid(np))
+    yy, xx = render_grid(np)
+    dx = xx - CENTER_X
+    dy = yy - CENTER_Y
+    return readonly(np.hypot(dx, dy)), readonly(np.arctan2(dy, dx))
+
+# Wrap an RGBA buffer as an image without copying it; Pillow keeps a
+# reference to the buffer for as long as the image is alive
+def wrap_rgba(buffer, width, height):
+    return Image.frombuffer("RGBA", (width, height), buffer, "raw", "RGBA", 0, 1)
+
+# Speckle, blur at render resolution, then upsample to the output size
+# Pixel-level effects that would not survive the coarser grid are passed as
+# draw_overlay; then the image is upsampled first, the overlay is drawn on
+# the full-resolution RGBA array and the blur runs at full resolution
+def finish_radar_image(rgba, speckle_chance, blur_radius, draw_overlay=None):
+    add_speckle_noise(rgba, chance=speckle_chance)
+    img = wrap_rgba(np.ascontiguousarray(rgba), rgba.shape[1], rgba.shape[0])
+    if draw_overlay is None:
+        img = img.filter(ImageFilter.GaussianBlur(radius=blur_radius / RENDER_SCALE))
+        return img.resize((WIDTH, HEIGHT), Image.BILINEAR)
+
+    full = np.array(img.resize((WIDTH, HEIGHT), Image.BILINEAR))
+    draw_overlay(full)
+    return wrap_rgba(full, WIDTH, HEIGHT).filter(ImageFilter.GaussianBlur(radius=blur_radius))
 
 # === Radar image generators ===
+# Each generator renders a batch of frames that differ only in rotation into
+# an (F, H, W, 4) buffer, computing every frame in one sweep by
+# broadcasting an (F, 1, 1) rotation column against the shared polar grid
 
-def generate_reflectivity_image(stage=1, intensity=50, rotation=0):
-    img = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-    pixels = img.load()
-
-    max_reflectivity = [35, 55, 75][stage - 1] * (intensity / 99)
-    storm_radius = [150, 200, 300][stage - 1]
-    num_lobes = [1, 2, 3][stage - 1]
+def rotation_column(rotations, xp):
+    return xp.asarray(np.asarray(rotations, dtype=np.float32).reshape(-1, 1, 1))
 
+# Lobe centers and the hook lobe for one frame; positions follow the rotation
+def storm_lobes(max_reflectivity, storm_radius, num_lobes, rotation):
     # Fixed seed for consistency
-    random.seed(42)
+    lobe_rng = np.random.default_rng(42)
     lobe_centers = []
     # Position lobes rotating around center
     for i in range(num_lobes):
@@ -108,8 +274,8 @@ def generate_reflectivity_image(stage=1, intensity=50, rotation=0):
         distance = 80
         cx = CENTER_X + int(math.cos(angle) * distance)
         cy = CENTER_Y + int(math.sin(angle) * distance)
-        strength = random.uniform(max_reflectivity * 0.5, max_reflectivity)
-        radius = random.randint(40, 80)
+        strength = lobe_rng.uniform(max_reflectivity * 0.5, max_reflectivity)
+        radius = int(lobe_rng.integers(40, 81))
         lobe_centers.append((cx, cy, strength, radius))
 
     # Hook lobe, rotates too
@@ -117,183 +283,181 @@ def generate_reflectivity_image(stage=1, intensity=50, rotation=0):
     hook_lobe = (CENTER_X + int(math.cos(hook_angle) * storm_radius * 0.5),
                  CENTER_Y + int(math.sin(hook_angle) * storm_radius * 0.5),
                  max_reflectivity * 0.8, int(storm_radius * 0.5))
+    return lobe_centers, hook_lobe
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - CENTER_X
-            dy = y - CENTER_Y
-            dist = math.sqrt(dx * dx + dy * dy)
-            if dist > storm_radius:
-                continue
-
-            val = max_reflectivity * (1 - dist / storm_radius) ** 2
-
-            for (cx, cy, strength, radius) in lobe_centers:
-                d = math.sqrt((x - cx) ** 2 + (y - cy) ** 2)
-                if d < radius:
-                    # Core intensity
-                    val += strength * (1 - d / radius) ** 1.5
-
-                    # Precipitation tails
-                    tail_vec_x = (x - cx)
-                    tail_vec_y = (y - cy)
-                    tail_length = 15
-                    # Tail points downstream roughly opposite the vector from center to lobe center
-                    tail_end_x = x + int(tail_vec_x * tail_length / max(radius,1))
-                    tail_end_y = y + int(tail_vec_y * tail_length / max(radius,1))
-                    # Draw faded tail pixel on the image
-                    # We’ll approximate tail by brightening pixels towards tail_end
-                    if 0 <= tail_end_x < WIDTH and 0 <= tail_end_y < HEIGHT:
-                        existing = pixels[tail_end_x, tail_end_y]
-                        # Increase brightness for tail
-                        tail_val = int(min(255, existing[0] + val * 2))
-                        pixels[tail_end_x, tail_end_y] = (tail_val, tail_val, 0, 180)
-
-            # Hook lobe contribution
-            d_hook = math.sqrt((x - hook_lobe[0]) ** 2 + (y - hook_lobe[1]) ** 2)
-            if d_hook < hook_lobe[3]:
-                val += hook_lobe[2] * (1 - d_hook / hook_lobe[3]) ** 2
-
-            val += random.uniform(-6, 6) * (intensity / 99)
-            val = max(0, min(80, val))
-
-            color = get_color_from_table(val, REFLECTIVITY_COLORS)
-            pixels[x, y] = color + (255,)
-
-    add_speckle_noise(pixels)
-    img = img.filter(ImageFilter.GaussianBlur(radius=1.2))
-    return img
-
-def generate_velocity_image(stage=1, intensity=50, rotation=0):
-    img = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-    pixels = img.load()
-
+def generate_reflectivity_images(stage, intensity, rotations, out):
+    max_reflectivity = [35, 55, 75][stage - 1] * (intensity / 99)
+    storm_radius = [150, 200, 300][stage - 1]
+    num_lobes = [1, 2, 3][stage - 1]
+    lobes = [storm_lobes(max_reflectivity, storm_radius, num_lobes, rotation) for rotation in rotations]
+
+    out.fill(0)
+    reflectivity_rgba(out, lobes, max_reflectivity, storm_radius, intensity)
+
+    return [finish_radar_image(frame, speckle_chance=0.002, blur_radius=1.2,
+                               draw_overlay=functools.partial(draw_reflectivity_tails, lobe_centers=lobe_centers,
+                                                              max_reflectivity=max_reflectivity, storm_radius=storm_radius))
+            for frame, (lobe_centers, _) in zip(to_host(out), lobes)]
+
+def reflectivity_rgba(rgba, lobes, max_reflectivity, storm_radius, intensity):
+    xp = array_module(rgba)
+    yy, xx = render_grid(xp)
+    dist, _ = polar_grid(xp)
+    outside = dist > storm_radius
+    # Per-frame lobe parameters, (F, num_lobes, 4) and (F, 4)
+    lobe_array = xp.asarray(np.array([lobe_centers for lobe_centers, _ in lobes], dtype=np.float32))
+    hook_array = xp.asarray(np.array([hook_lobe for _, hook_lobe in lobes], dtype=np.float32))
+
+    val = max_reflectivity * xp.clip(1 - dist / storm_radius, 0, None) ** 2
+    val = xp.repeat(val[None], len(lobes), axis=0)
+
+    for i in range(lobe_array.shape[1]):
+        cx, cy, strength, radius = (lobe_array[:, i, k] for k in range(4))
+        # Only take the square root inside the lobe
+        d_sq = (xx - cx[:, None, None]) ** 2 + (yy - cy[:, None, None]) ** 2
+        fs, ys, xs = xp.nonzero((d_sq < (radius * radius)[:, None, None]) & ~outside)
+        # Core intensity
+        val[fs, ys, xs] += strength[fs] * (1 - xp.sqrt(d_sq[fs, ys, xs]) / radius[fs]) ** 1.5
+
+    # Hook lobe contribution
+    hx, hy, hook_strength, hook_radius = (hook_array[:, k] for k in range(4))
+    d_hook_sq = (xx - hx[:, None, None]) ** 2 + (yy - hy[:, None, None]) ** 2
+    fs, ys, xs = xp.nonzero(d_hook_sq < (hook_radius * hook_radius)[:, None, None])
+    val[fs, ys, xs] += hook_strength[fs] * (1 - xp.sqrt(d_hook_sq[fs, ys, xs]) / hook_radius[fs]) ** 2
+
+    val += noise_field(6 * (intensity / 99), val.shape, xp)
+    val = xp.clip(val, 0, 80)
+
+    colorize_field(rgba, val, outside, "REFLECTIVITY")
+
+# Precipitation tails for one frame, drawn on the full-resolution RGBA array:
+# every storm pixel inside a lobe brightens the pixel it points at.
+# Tails are a per-pixel scatter, so on the render grid they turned into a
+# coarse lattice; here they keep the original pixel spacing
+def draw_reflectivity_tails(rgba, lobe_centers, max_reflectivity, storm_radius):
+    tail_length = 15
+    for i, (cx, cy, strength, radius) in enumerate(lobe_centers):
+        # Source pixels: the lobe's bounding box, cut down to the lobe and the storm
+        ys, xs = np.mgrid[max(cy - radius, 0):min(cy + radius + 1, HEIGHT),
+                          max(cx - radius, 0):min(cx + radius + 1, WIDTH)]
+        dist_sq = (xs - CENTER_X) ** 2 + (ys - CENTER_Y) ** 2
+        inside = ((xs - cx) ** 2 + (ys - cy) ** 2 < radius * radius) & (dist_sq <= storm_radius * storm_radius)
+        ys, xs = ys[inside], xs[inside]
+
+        # Field value at the source once this lobe is added, before the hook and noise
+        tail_src = max_reflectivity * (1 - np.sqrt(dist_sq[inside]) / storm_radius) ** 2
+        for (lx, ly, lobe_strength, lobe_radius) in lobe_centers[:i + 1]:
+            d = np.sqrt((xs - lx) ** 2 + (ys - ly) ** 2)
+            tail_src += lobe_strength * np.clip(1 - d / lobe_radius, 0, None) ** 1.5
+
+        # Tail points downstream roughly opposite the vector from center to lobe center
+        tail_end_x = xs + ((xs - cx) * tail_length / max(radius, 1)).astype(int)
+        tail_end_y = ys + ((ys - cy) * tail_length / max(radius, 1)).astype(int)
+
+        # In a raster scan only tails landing on pixels that were already
+        # coloured (or lie outside the storm) would survive
+        on_image = (tail_end_x >= 0) & (tail_end_x < WIDTH) & (tail_end_y >= 0) & (tail_end_y < HEIGHT)
+        scanned = (tail_end_y < ys) | ((tail_end_y == ys) & (tail_end_x < xs))
+        outside = (tail_end_x - CENTER_X) ** 2 + (tail_end_y - CENTER_Y) ** 2 > storm_radius * storm_radius
+        keep = on_image & (scanned | outside)
+        tail_end_y, tail_end_x, tail_src = tail_end_y[keep], tail_end_x[keep], tail_src[keep]
+
+        # Increase brightness for tail
+        tail_val = np.minimum(255, rgba[tail_end_y, tail_end_x, 0] + tail_src * 2).astype(np.uint8)
+        rgba[tail_end_y, tail_end_x, 0] = tail_val
+        rgba[tail_end_y, tail_end_x, 1] = tail_val
+        rgba[tail_end_y, tail_end_x, 2] = 0
+        rgba[tail_end_y, tail_end_x, 3] = 180
+
+def generate_velocity_images(stage, intensity, rotations, out):
     max_radius = [150, 200, 300][stage - 1]
     velocity_amp = [30, 50, 80][stage - 1] * (intensity / 99)
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - CENTER_X
-            dy = y - CENTER_Y
-            dist = math.sqrt(dx * dx + dy * dy)
-            if dist > max_radius:
-                continue
+    xp = array_module(out)
+    out.fill(0)
+    dist, angle = polar_grid(xp)
+    angle = angle + rotation_column(rotations, xp)
+    base_val = velocity_amp * xp.sin(2 * angle) * (1 - dist / max_radius)
+    noise = noise_field(10 * (intensity / 99), base_val.shape, xp)
+    val = xp.clip(base_val + noise, -120, 120)
 
-            angle = math.atan2(dy, dx) + rotation
-            base_val = velocity_amp * math.sin(2 * angle) * (1 - dist / max_radius)
-            noise = random.uniform(-10, 10) * (intensity / 99)
-            val = max(-120, min(120, base_val + noise))
+    colorize_field(out, val, dist > max_radius, "VELOCITY")
 
-            color = get_color_from_table(val, VELOCITY_COLORS)
-            pixels[x, y] = color + (255,)
-
-    add_speckle_noise(pixels, chance=0.002)
-    img = img.filter(ImageFilter.GaussianBlur(radius=1.2))
-    return img
-
-def generate_zdr_image(stage=1, intensity=50, rotation=0):
-    img = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-    pixels = img.load()
+    return [finish_radar_image(frame, speckle_chance=0.002, blur_radius=1.2) for frame in to_host(out)]
 
+def generate_zdr_images(stage, intensity, rotations, out):
     radius = [150, 200, 300][stage - 1]
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - CENTER_X
-            dy = y - CENTER_Y
-            dist = math.sqrt(dx*dx + dy*dy)
-            if dist > radius:
-                continue
-
-            angle = math.atan2(dy, dx) + rotation
-            # Simulate positive ZDR around hail core, low in rain
-            val = 1.5 * math.exp(-((dist - 50)/40)**2) * math.cos(angle*3)  
-            # Add noise
-            val += random.uniform(-0.5, 0.5) * (intensity / 99)
-            val = max(-2, min(2, val))
+    xp = array_module(out)
+    out.fill(0)
+    dist, angle = polar_grid(xp)
+    angle = angle + rotation_column(rotations, xp)
+    # Simulate positive ZDR around hail core, low in rain
+    val = 1.5 * xp.exp(-((dist - 50) / 40) ** 2) * xp.cos(angle * 3)
+    # Add noise
+    val += noise_field(0.5 * (intensity / 99), val.shape, xp)
+    val = xp.clip(val, -2, 2)
 
-            color = get_color_from_table(val, ZDR_COLORS)
-            pixels[x, y] = color + (255,)
+    colorize_field(out, val, dist > radius, "ZDR")
 
-    add_speckle_noise(pixels)
-    img = img.filter(ImageFilter.GaussianBlur(radius=1.0))
-    return img
-
-def generate_cc_image(stage=1, intensity=50, rotation=0):
-    img = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-    pixels = img.load()
+    return [finish_radar_image(frame, speckle_chance=0.002, blur_radius=1.0) for frame in to_host(out)]
 
+def generate_cc_images(stage, intensity, rotations, out):
     radius = [150, 200, 300][stage - 1]
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - CENTER_X
-            dy = y - CENTER_Y
-            dist = math.sqrt(dx*dx + dy*dy)
-            if dist > radius:
-                continue
-
-            # Lower CC inside hail shaft or debris
-            val = 0.95 - 0.6 * math.exp(-((dist - 70)/40)**2) * abs(math.sin(rotation*4 + dist/10))
-            val += random.uniform(-0.05, 0.05) * (intensity / 99)
-            val = max(0, min(1, val))
+    xp = array_module(out)
+    out.fill(0)
+    dist, _ = polar_grid(xp)
+    rotation = rotation_column(rotations, xp)
 
-            color = get_color_from_table(val, CC_COLORS)
-            pixels[x, y] = color + (255,)
+    # Lower CC inside hail shaft or debris
+    val = 0.95 - 0.6 * xp.exp(-((dist - 70) / 40) ** 2) * xp.abs(xp.sin(rotation * 4 + dist / 10))
+    val += noise_field(0.05 * (intensity / 99), val.shape, xp)
+    val = xp.clip(val, 0, 1)
 
-    add_speckle_noise(pixels, chance=0.001)
-    img = img.filter(ImageFilter.GaussianBlur(radius=1.0))
-    return img
+    colorize_field(out, val, dist > radius, "CC")
 
-def generate_sw_image(stage=1, intensity=50, rotation=0):
-    img = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-    pixels = img.load()
+    return [finish_radar_image(frame, speckle_chance=0.001, blur_radius=1.0) for frame in to_host(out)]
 
+def generate_sw_images(stage, intensity, rotations, out):
     radius = [150, 200, 300][stage - 1]
 
-    for y in range(HEIGHT):
-        for x in range(WIDTH):
-            dx = x - CENTER_X
-            dy = y - CENTER_Y
-            dist = math.sqrt(dx*dx + dy*dy)
-            if dist > radius:
-                continue
+    xp = array_module(out)
+    out.fill(0)
+    dist, _ = polar_grid(xp)
+    rotation = rotation_column(rotations, xp)
 
-            # Higher spectrum width near turbulent areas
-            val = 3 * math.exp(-((dist - 80)/30)**2) * abs(math.sin(rotation*6 + dist/15))
-            val += random.uniform(-0.5, 0.5) * (intensity / 99)
-            val = max(0, min(5, val))
+    # Higher spectrum width near turbulent areas
+    val = 3 * xp.exp(-((dist - 80) / 30) ** 2) * xp.abs(xp.sin(rotation * 6 + dist / 15))
+    val += noise_field(0.5 * (intensity / 99), val.shape, xp)
+    val = xp.clip(val, 0, 5)
 
-            color = get_color_from_table(val, SW_COLORS)
-            pixels[x, y] = color + (255,)
+    colorize_field(out, val, dist > radius, "SW")
 
-    add_speckle_noise(pixels, chance=0.0015)
-    img = img.filter(ImageFilter.GaussianBlur(radius=1.0))
-    return img
+    return [finish_radar_image(frame, speckle_chance=0.0015, blur_radius=1.0) for frame in to_host(out)]
 
 # Gate-to-Gate shear highlight for velocity
 def add_gtg_shear_overlay(img, threshold=90):
-    pixels = img.load()
-    width, height = img.size
-
-    # Create overlay image to mark GTG shear areas
-    overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    overlay_pixels = overlay.load()
+    arr = np.array(img)
 
     # We approximate shear by checking horizontal neighbors' red channel difference
-    for y in range(height):
-        for x in range(width-1):
-            r1, g1, b1, a1 = pixels[x, y]
-            r2, g2, b2, a2 = pixels[x+1, y]
-
-            diff = abs(r1 - r2)  # rough proxy for velocity diff
-
-            if diff > threshold:
-                # Mark shear pixel bright magenta
-                overlay_pixels[x, y] = (255, 0, 255, 180)
-                overlay_pixels[x+1, y] = (255, 0, 255, 180)
-
-    return Image.alpha_composite(img, overlay)
+    red = arr[:, :, 0].astype(np.int16)
+    shear = np.abs(red[:, 1:] - red[:, :-1]) > threshold  # rough proxy for velocity diff
+    mask = np.zeros(red.shape, dtype=bool)
+    mask[:, :-1] |= shear
+    mask[:, 1:] |= shear
+
+    # Mark shear pixels bright magenta, blended in place the same way
+    # alpha compositing a magenta overlay would
+    src_alpha = 180 / 255
+    dst = arr[mask].astype(np.float32) / 255
+    dst_alpha = dst[:, 3:] * (1 - src_alpha)
+    out_alpha = src_alpha + dst_alpha
+    rgb = (np.array([1.0, 0.0, 1.0]) * src_alpha + dst[:, :3] * dst_alpha) / out_alpha
+    arr[mask, :3] = np.rint(rgb * 255).astype(np.uint8)
+    arr[mask, 3] = np.rint(out_alpha[:, 0] * 255).astype(np.uint8)
+
+    return Image.fromarray(arr)
 
 # Storm attributes sidebar
 def draw_storm_attributes(draw, font_big, font_small, max_reflectivity, hail_size, rotation_strength, tvs_prob):
@@ -328,16 +492,57 @@ def draw_storm_attributes(draw, font_big, font_small, max_reflectivity, hail_siz
 
 # Generate a polygon for severe thunderstorm warning
 def generate_severe_polygon():
-    radius = random.randint(120, 200)
-    center_angle = random.uniform(0, 2 * math.pi)
-    points = []
-    for i in range(random.randint(5, 7)):
-        angle = center_angle + i * (2 * math.pi / 6) + random.uniform(-0.2, 0.2)
-        r = radius + random.randint(-30, 30)
-        x = CENTER_X + math.cos(angle) * r
-        y = CENTER_Y + math.sin(angle) * r
-        points.append((x, y))
-    return points
+    radius = RNG.integers(120, 201)
+    center_angle = RNG.uniform(0, 2 * math.pi)
+    num_points = RNG.integers(5, 8)
+    angles = center_angle + np.arange(num_points) * (2 * math.pi / 6) + RNG.uniform(-0.2, 0.2, num_points)
+    r = radius + RNG.integers(-30, 31, num_points)
+    points = np.stack([CENTER_X + np.cos(angles) * r, CENTER_Y + np.sin(angles) * r], axis=-1)
+    return [tuple(point) for point in points.tolist()]
+
+# Generate radar overlays based on product, one per rotation, rendered into
+# an (F, H, W, 4) buffer; passing a CuPy buffer runs the field math on the GPU
+def generate_radar_images(product, stage, intensity, rotations, out):
+    if product == "VELOCITY":
+        radar_imgs = generate_velocity_images(stage, intensity, rotations, out)
+        radar_imgs = [add_gtg_shear_overlay(img, threshold=40) for img in radar_imgs]  # lower threshold for demo
+    elif product == "ZDR":
+        radar_imgs = generate_zdr_images(stage, intensity, rotations, out)
+    elif product == "CC":
+        radar_imgs = generate_cc_images(stage, intensity, rotations, out)
+    elif product == "SW":
+        radar_imgs = generate_sw_images(stage, intensity, rotations, out)
+    elif product == "REFLECTIVITY":
+        radar_imgs = generate_reflectivity_images(stage, intensity, rotations, out)
+    else:
+        raise ValueError(f"Unknown radar product: {product}")
+    return radar_imgs
+
+def generate_radar_image(product, stage, intensity, rotation, out=None):
+    out = scratch_buffer(1) if out is None else out[None]
+    return generate_radar_images(product, stage, intensity, [rotation], out)[0]
+
+# Render any number of rotations in batches of at most FRAME_BATCH frames,
+# on the CPU scratch buffer or in a device buffer when xp is CuPy. Frames
+# are yielded batch by batch so callers need not hold them all
+def generate_radar_frames(product, stage, intensity, rotations, xp=np):
+    batch = min(FRAME_BATCH, len(rotations))
+    if xp is np:
+        out = scratch_buffer(batch)
+    else:
+        out = xp.zeros((batch, RENDER_HEIGHT, RENDER_WIDTH, 4), dtype=np.uint8)
+    for i in range(0, len(rotations), batch):
+        chunk = rotations[i:i + batch]
+        yield from generate_radar_images(product, stage, intensity, chunk, out[:len(chunk)])
+
+# Pool worker: reseed the process-local RNG so forked workers don't repeat
+# each other's noise, render a chunk of rotations in batches, and hand
+# back raw RGBA bytes instead of PIL images
+def render_radar_frames(job):
+    global RNG
+    product, stage, intensity, rotations, seed = job
+    RNG = np.random.default_rng(seed)
+    return [img.tobytes() for img in generate_radar_frames(product, stage, intensity, rotations)]
 
 def draw_colorbar(draw, x, y, width, height, colors, labels, font):
     seg_width = width / len(colors)
@@ -348,36 +553,41 @@ def draw_colorbar(draw, x, y, width, height, colors, labels, font):
         draw.text((label_x, y + height + 2), label, fill="white", font=font)
 
 def main():
-    # Default parameters
-    stage = 1
-    intensity = 50
-    product = "REFLECTIVITY"
-    polygon_enabled = False
-    gif_mode = False
-    frames_count = 20
-
     # Parse args
-    for arg in sys.argv[1:]:
-        if arg.startswith("--stage"):
-            stage = int(arg.replace("--stage", ""))
-        elif arg.startswith("--intensity"):
-            intensity = max(1, min(99, int(arg.replace("--intensity", ""))))
-        elif arg.startswith("--product"):
-            product = arg.replace("--product", "").upper()
-        elif arg == "--polygon":
-            polygon_enabled = True
-        elif arg == "--gif":
-            gif_mode = True
-        elif arg.startswith("--frames"):
-            frames_count = int(arg.replace("--frames", ""))
+    parser = argparse.ArgumentParser(description="Generate a synthetic Bordeaux radar image or GIF.")
+    parser.add_argument("--stage", type=int, default=1, choices=[1, 2, 3], help="storm stage")
+    parser.add_argument("--intensity", type=int, default=50, help="intensity level, clamped to 1-99")
+    parser.add_argument("--product", type=str.upper, default="REFLECTIVITY", choices=list(PALETTES), help="radar product")
+    parser.add_argument("--polygon", action="store_true", help="draw a severe thunderstorm warning polygon")
+    parser.add_argument("--gif", action="store_true", help="render an animated GIF instead of a PNG")
+    parser.add_argument("--frames", type=int, default=20, help="number of GIF frames")
+    parser.add_argument("--gpu", action="store_true", help="render the radar fields on the GPU with CuPy")
+    args = parser.parse_args()
+    if args.frames < 1:
+        parser.error("--frames must be at least 1")
+
+    stage = args.stage
+    intensity = max(1, min(99, args.intensity))
+    product = args.product
+    polygon_enabled = args.polygon
+    gif_mode = args.gif
+    frames_count = args.frames
+
+    # Optional: keep the render buffers on the GPU so the field math runs there
+    xp = np
+    if args.gpu:
+        if load_cupy() is not None:
+            xp = cupy
+        else:
+            print("[WARN] CuPy or a CUDA device is not available, rendering on the CPU")
 
     print(f"[INFO] Generating product {product} (stage {stage}, intensity {intensity})")
 
     # Storm attributes randomized realistically
-    max_reflectivity = random.uniform(40, 78)
-    hail_size = random.uniform(0.5, 3.5)
-    rotation_strength = random.choice(["Weak", "Moderate", "Strong"])
-    tvs_prob = random.randint(30, 99)
+    max_reflectivity = RNG.uniform(40, 78)
+    hail_size = RNG.uniform(0.5, 3.5)
+    rotation_strength = str(RNG.choice(["Weak", "Moderate", "Strong"]))
+    tvs_prob = int(RNG.integers(30, 100))
 
     # Load map background
     if os.path.exists(MAP_IMAGE_PATH):
@@ -392,113 +602,117 @@ def main():
         font_small = ImageFont.load_default()
         font_big = ImageFont.load_default()
 
-    def generate_frame(rotation_angle):
-        # Generate radar overlay based on product
-        if product == "VELOCITY":
-            radar_img = generate_velocity_image(stage, intensity, rotation_angle)
-            radar_img = add_gtg_shear_overlay(radar_img, threshold=40)  # lower threshold for demo
-        elif product == "ZDR":
-            radar_img = generate_zdr_image(stage, intensity, rotation_angle)
-        elif product == "CC":
-            radar_img = generate_cc_image(stage, intensity, rotation_angle)
-        elif product == "SW":
-            radar_img = generate_sw_image(stage, intensity, rotation_angle)
-        else:
-            radar_img = generate_reflectivity_image(stage, intensity, rotation_angle)
-
+    # Everything drawn over the radar that doesn't change between frames is
+    # rendered once into a transparent layer
+    static_layer = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(static_layer)
+
+    # Draw grid and blind spot
+    draw_grid(draw)
+    draw.ellipse(
+        [
+            (CENTER_X - BLIND_SPOT_RADIUS, CENTER_Y - BLIND_SPOT_RADIUS),
+            (CENTER_X + BLIND_SPOT_RADIUS, CENTER_Y + BLIND_SPOT_RADIUS),
+        ],
+        fill=(0, 0, 0, 255),
+    )
+
+    # Radar text center label
+    text_lines = ["KBDX", "(KRAD Bordeaux)"]
+    total_text_height = sum(get_text_size(font_small, line)[1] for line in text_lines)
+    start_y = CENTER_Y - total_text_height // 2
+    for line in text_lines:
+        text_width, text_height = get_text_size(font_small, line)
+        draw.text((CENTER_X - text_width // 2, start_y), line, fill="white", font=font_small)
+        start_y += text_height
+
+    # Timestamp and titles
+    utcnow = datetime.utcnow()
+    timestamp_str = f"{utcnow.month}_{utcnow.day}_{utcnow.year}_{utcnow.strftime('%H%M')}UTC"
+    product_str = {
+        "VELOCITY": "VELOCITYRADIAL",
+        "ZDR": "DIFFERENTIALREFLECTIVITY",
+        "CC": "CORRELATIONCOEFFICIENT",
+        "SW": "SPECTRUMWIDTH",
+        "REFLECTIVITY": "COMPOSITEREFLECTIVITY"
+    }[product]
+
+    draw.text((20, 20), f"RADAR: {RADAR_NAME}", fill="white", font=font_big)
+    title_map = {
+        "VELOCITY": "Storm Relative Velocity",
+        "ZDR": "Differential Reflectivity (ZDR)",
+        "CC": "Correlation Coefficient (CC)",
+        "SW": "Spectrum Width",
+        "REFLECTIVITY": "Composite Reflectivity"
+    }
+    draw.text((20, 50), title_map[product], fill="white", font=font_big)
+    draw.text((20, 80), utcnow.strftime("%Y-%m-%d %H:%M UTC"), fill="white", font=font_big)
+
+    # Draw color bar
+    colors, labels = COLORBAR_SPEC[product]
+    draw_colorbar(draw, 50, HEIGHT - 80, 660, 30, colors, labels, font_small)
+
+    # Draw severe polygon if enabled; it is generated once per run so it
+    # stays put across GIF frames
+    if polygon_enabled:
+        poly_points = generate_severe_polygon()
+        overlay = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
+        overlay_draw = ImageDraw.Draw(overlay)
+        overlay_draw.polygon(poly_points, outline="yellow", fill=(255, 255, 0, int(255 * 0.4)))
+        static_layer = Image.alpha_composite(static_layer, overlay)
+
+        # Label polygon
+        label_pos = poly_points[0]
+        overlay_draw.text((label_pos[0] + 10, label_pos[1] - 10), "Severe Thunderstorm Warning", fill="yellow", font=font_big)
+
+        static_layer = Image.alpha_composite(static_layer, overlay)
+        draw = ImageDraw.Draw(static_layer)
+
+    # Draw storm attributes sidebar
+    draw_storm_attributes(draw, font_big, font_small, max_reflectivity, hail_size, rotation_strength, tvs_prob)
+
+    def generate_frame(radar_img):
         combined = Image.alpha_composite(base_img, radar_img)
-        draw = ImageDraw.Draw(combined)
-
-        # Draw grid and blind spot
-        draw_grid(draw)
-        draw.ellipse(
-            [
-                (CENTER_X - BLIND_SPOT_RADIUS, CENTER_Y - BLIND_SPOT_RADIUS),
-                (CENTER_X + BLIND_SPOT_RADIUS, CENTER_Y + BLIND_SPOT_RADIUS),
-            ],
-            fill=(0, 0, 0, 255),
-        )
-
-        # Radar text center label
-        text_lines = ["KBDX", "(KRAD Bordeaux)"]
-        total_text_height = sum(get_text_size(font_small, line)[1] for line in text_lines)
-        start_y = CENTER_Y - total_text_height // 2
-        for line in text_lines:
-            text_width, text_height = get_text_size(font_small, line)
-            draw.text((CENTER_X - text_width // 2, start_y), line, fill="white", font=font_small)
-            start_y += text_height
-
-        # Timestamp and titles
-        utcnow = datetime.utcnow()
-        timestamp_str = f"{utcnow.month}_{utcnow.day}_{utcnow.year}_{utcnow.strftime('%H%M')}UTC"
-        product_str = {
-            "VELOCITY": "VELOCITYRADIAL",
-            "ZDR": "DIFFERENTIALREFLECTIVITY",
-            "CC": "CORRELATIONCOEFFICIENT",
-            "SW": "SPECTRUMWIDTH",
-            "REFLECTIVITY": "COMPOSITEREFLECTIVITY"
-        }.get(product, "COMPOSITEREFLECTIVITY")
-
-        draw.text((20, 20), f"RADAR: {RADAR_NAME}", fill="white", font=font_big)
-        title_map = {
-            "VELOCITY": "Storm Relative Velocity",
-            "ZDR": "Differential Reflectivity (ZDR)",
-            "CC": "Correlation Coefficient (CC)",
-            "SW": "Spectrum Width",
-            "REFLECTIVITY": "Composite Reflectivity"
-        }
-        draw.text((20, 50), title_map.get(product, "Composite Reflectivity"), fill="white", font=font_big)
-        draw.text((20, 80), utcnow.strftime("%Y-%m-%d %H:%M UTC"), fill="white", font=font_big)
-
-        # Draw color bar
-        if product == "VELOCITY":
-            colors = [c for _, _, c in VELOCITY_COLORS]
-            labels = ["-120", "-60", "-40", "-20", "0", "20", "40", "120"]
-        elif product == "ZDR":
-            colors = [c for _, _, c in ZDR_COLORS]
-            labels = ["-2", "-0.5", "0.5", "2"]
-        elif product == "CC":
-            colors = [c for _, _, c in CC_COLORS]
-            labels = ["0", "0.6", "0.9", "1"]
-        elif product == "SW":
-            colors = [c for _, _, c in SW_COLORS]
-            labels = ["0", "1", "2", "5"]
-        else:
-            colors = [c for _, _, c in REFLECTIVITY_COLORS]
-            labels = ["0", "5", "20", "30", "40", "50", "60", "80"]
-
-        draw_colorbar(draw, 50, HEIGHT - 80, 660, 30, colors, labels, font_small)
-
-        # Draw severe polygon if enabled
-        if polygon_enabled:
-            poly_points = generate_severe_polygon()
-            overlay = Image.new("RGBA", (WIDTH, HEIGHT), (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            overlay_draw.polygon(poly_points, outline="yellow", fill=(255, 255, 0, int(255 * 0.4)))
-            combined = Image.alpha_composite(combined, overlay)
-
-            # Label polygon
-            label_pos = poly_points[0]
-            overlay_draw.text((label_pos[0] + 10, label_pos[1] - 10), "Severe Thunderstorm Warning", fill="yellow", font=font_big)
-
-            combined = Image.alpha_composite(combined, overlay)
-
-        # Draw storm attributes sidebar
-        draw_storm_attributes(draw, font_big, font_small, max_reflectivity, hail_size, rotation_strength, tvs_prob)
-
+        combined = Image.alpha_composite(combined, static_layer)
         return combined
 
-    if gif_mode:
+    # Quantize every frame against one palette taken from the first frame,
+    # rather than letting the GIF writer build a new palette per frame.
+    # 255 colors leaves an index free to mark pixels unchanged since the
+    # previous frame, so only the radar area is stored after frame one.
+    # Frames are consumed one at a time, so only the paletted copies are kept
+    def quantize_frames(radar_frames):
         frames = []
-        for i in range(frames_count):
-            rotation_angle = 2 * math.pi * i / frames_count
-            frame = generate_frame(rotation_angle)
-            frames.append(frame)
+        for radar_img in radar_frames:
+            frame = generate_frame(radar_img).convert("RGB")
+            if not frames:
+                master_palette = frame.quantize(colors=255, method=Image.Quantize.FASTOCTREE)
+            frames.append(frame.quantize(palette=master_palette, dither=Image.Dither.NONE))
+        return frames
+
+    if gif_mode:
+        rotations = [2 * math.pi * i / frames_count for i in range(frames_count)]
+        workers = min(os.cpu_count() or 1, frames_count)
+        if xp is not np or workers == 1:
+            # The GPU is owned by this process, and with a single worker there
+            # is nothing to parallelize, so skip the pool's startup and the
+            # pickling of every frame
+            frames = quantize_frames(generate_radar_frames(product, stage, intensity, rotations, xp))
+        else:
+            # Frames only depend on their rotation, so each worker renders a
+            # contiguous chunk of rotations in batches
+            seeds = RNG.integers(2 ** 63, size=workers)
+            jobs = [(product, stage, intensity, chunk.tolist(), seed)
+                    for chunk, seed in zip(np.array_split(rotations, workers), seeds)]
+            with multiprocessing.Pool(workers) as pool:
+                frames = quantize_frames(wrap_rgba(data, WIDTH, HEIGHT)
+                                         for chunk in pool.imap(render_radar_frames, jobs) for data in chunk)
         output_filename = f"BORDEAUX_{product}_GIF_{frames_count}frames_{datetime.utcnow().strftime('%m_%d_%Y_%H%MUTC')}.gif"
-        frames[0].save(output_filename, save_all=True, append_images=frames[1:], optimize=False, duration=100, loop=0)
+        frames[0].save(output_filename, save_all=True, append_images=frames[1:], optimize=True, duration=100, loop=0)
         print(f"[INFO] Saved GIF animation to {output_filename}")
     else:
-        frame = generate_frame(0)
+        out = None if xp is np else xp.zeros((RENDER_HEIGHT, RENDER_WIDTH, 4), dtype=np.uint8)
+        frame = generate_frame(generate_radar_image(product, stage, intensity, 0, out))
         output_filename = f"{datetime.utcnow().strftime('%m_%d_%Y_%H%MUTC')}_BORDEAUX_{product}_VIEW.png"
         frame.convert("RGB").save(output_filename)
         print(f"[INFO] Saved image to {output_filename}")